@@ -38,23 +38,60 @@ Examples:
 
 import argparse             # Arguments parser
 import logging, coloredlogs                 # Standard logging functionality with colors functionality
+from contextlib import asynccontextmanager  # Application lifespan definition
 
 # Modules required to run FastAPI
 import uvicorn  # Python web server
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 # Custom modules of Granef API
 from utilities.dgraph_client import DgraphClient
+from utilities.dgraph_schema import DgraphSchema
+from utilities.responses import ORJSONResponse
 from routers import general_queries, overview_queries, graph_queries, analysis_queries
 
 
+# Command line arguments (set only if the API is started as a script)
+args = None
+
+# Application logger
+logger = logging.getLogger("granef-analysis-api")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Connect to Dgraph within the event loop of the API web server before the first request is served. The connection
+    is established only if the API is started as a script with Dgraph server arguments.
+    """
+    if args is not None:
+        dgraph_client = DgraphClient()
+        await dgraph_client.connect(ip=args.dgraph_ip, port=int(args.dgraph_port), pool_size=args.dgraph_pool)
+        # Load the database schema, queries fall back to expand(_all_) if it is not available
+        try:
+            await DgraphSchema().load()
+        except HTTPException as e:
+            logger.warning("Dgraph schema not loaded: {0}".format(e.detail))
+        # Pre-warm the query cache with hosts information of given network ranges
+        if args.warm_subnets:
+            warmed = await overview_queries.warm_hosts_info([address.strip() for address in args.warm_subnets.split(",")])
+            logger.info("Query cache warmed: {0}".format(warmed))
+    yield
+
+
 # Application definition ("description" key may be added too).
 app = FastAPI(
     title="Granef API",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
+# Compress larger responses for clients accepting gzip encoding
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Load API routers
 app.include_router(general_queries.router, tags=["General"])
 app.include_router(graph_queries.router, prefix="/graph", tags=["Graph queries"])
@@ -72,14 +109,15 @@ def get_root(request: Request) -> dict:
 
 
 @app.get("/connect", summary="Re-establish connection to the Dgraph database server", tags=["General"])
-def dgraph_connect() -> dict:
+async def dgraph_connect() -> dict:
     """
     The connection is automatically established with Granef API start. Call this function only if some
     connection error occurred.
     """
     dgraph_client = DgraphClient()
     try:
-        dgraph_client.connect(ip=args.dgraph_ip, port=args.dgraph_port)
+        await dgraph_client.connect(ip=args.dgraph_ip, port=args.dgraph_port, pool_size=args.dgraph_pool)
+        await DgraphSchema().load()
     except Exception as e:
         raise HTTPException(
             status_code=503,
@@ -96,12 +134,12 @@ if __name__ == "__main__":
     parser.add_argument("-p", "--port", help="Port to bind the API web server.", type=int, default=7000)
     parser.add_argument("-di", "--dgraph_ip", help="Dgraph server IP addres.", type=str, default="alpha")
     parser.add_argument("-dp", "--dgraph_port", help="Dgraph server port.", type=int, default=9080)
+    parser.add_argument("-dc", "--dgraph_pool", help="Number of gRPC connections to the Dgraph server.", type=int, default=8)
+    parser.add_argument("-ws", "--warm_subnets", help="Comma separated network ranges (CIDR) to cache hosts information at start.", type=str, default="")
     parser.add_argument("-l", "--log", choices=["debug", "info", "warning", "error", "critical"], help="Log level", required=False, default="INFO")
-    global args
     args = parser.parse_args()
 
     # Set logging
-    logger = logging.getLogger("granef-analysis-api")
     coloredlogs.install(level=getattr(logging, args.log.upper()), fmt="%(asctime)s %(name)s [%(levelname)s]: %(message)s")
 
     # Set HTTP headers and allow all connection
@@ -113,9 +151,5 @@ if __name__ == "__main__":
         allow_headers=["*"],
     )
 
-    # Initialize dgraph client
-    dgraph_client = DgraphClient()
-    dgraph_client.connect(ip=args.dgraph_ip, port=int(args.dgraph_port))
-
     # Start API web server using Uvicorn server
     uvicorn.run(app, host=args.ip, port=int(args.port))
@@ -42,6 +42,8 @@ class UidsQuery(BaseModel):
 class AttributeValueQuery(BaseModel):
     attribute: str = Field(None, example='FlowRec.protocol')
     value: str = Field(None, example='tcp')
+    limit: int = Field(500, ge=1, le=10000, example=500)  # Maximal number of nodes returned by one request
+    offset: Optional[int] = Field(0, ge=0, example=0)
 
 class UidsTimestampsRangeQuery(BaseModel):
     uids: str = Field(None, example='0x12, 0x9c882')
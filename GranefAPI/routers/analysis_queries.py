@@ -24,9 +24,6 @@
 Definition of common analytical queries focused on network traffic analysis.
 """
 
-# Common Python modules
-import json
-
 # FastAPI modules
 from fastapi import APIRouter
 from fastapi import HTTPException
@@ -35,17 +32,39 @@ from fastapi import HTTPException
 from models import query_models
 from utilities import validation, preprocessing
 from utilities.dgraph_client import DgraphClient
+from utilities.responses import block_response
 from .graph_queries import filter_uids
 
 
 # Initialize FastAPI router
 router = APIRouter()
 
+# Shared Dgraph client (singleton connected at the application start)
+dgraph_client = DgraphClient()
+
+
+# Query templates of the router endpoints (user values are passed as Dgraph query variables). Static queries
+# are extended by default attributes only once at import.
+_CONNECTIONS_SEARCH_QUERY = preprocessing.add_default_attributes("""query connections_search($address_orig: string, $address_resp: string, $timestamp_min: string, $timestamp_max: string) {
+    connections_search(func: allof(Host.ip, cidr, $address_orig)) @cascade {
+        Host.ip
+        <~FlowRec.originated_by> @filter(ge(FlowRec.first_ts, $timestamp_min) and le(FlowRec.first_ts, $timestamp_max)) {
+            FlowRec.first_ts
+            FlowRec.orig_port
+            FlowRec.recv_port
+            FlowRec.protocol
+            FlowRec.received_by @filter(allof(Host.ip, cidr, $address_resp)) {
+                Host.ip
+            }
+        }
+    }
+}""")
+
 
 @router.post("/connections_search",
     response_model=query_models.GeneralResponseList,
     summary="Search for connections within a specified time range and between two hosts.")
-def connections_search(request: query_models.AdressesTimestampsQuery) -> dict:
+async def connections_search(request: query_models.AdressesTimestampsQuery) -> dict:
     """
     Get all connections within the given time range and between defined two hosts. If only one address is
     defined, it is searched for all originating or responding connections. If only one timestamp is defined,
@@ -61,24 +80,14 @@ def connections_search(request: query_models.AdressesTimestampsQuery) -> dict:
     # Validate IP address and raise exception if not valid
     validation.validate(address_orig, "address")
     validation.validate(address_resp, "address")
-    
-    dgraph_client = DgraphClient()
-
-    query = f"""{{
-        connections_search(func: allof(Host.ip, cidr, "{address_orig}")) @cascade {{
-            Host.ip
-            <~FlowRec.originated_by> @filter(ge(FlowRec.first_ts, "{timestamp_min}") and le(FlowRec.first_ts, "{timestamp_max}")) {{
-			    FlowRec.first_ts
-                FlowRec.orig_port
-                FlowRec.recv_port
-                FlowRec.protocol
-                FlowRec.received_by @filter(allof(Host.ip, cidr, "{address_resp}")) {{
-				    Host.ip
-                }}
-            }}
-        }}
-    }}"""
+    variables = {
+        "$address_orig": address_orig,
+        "$address_resp": address_resp,
+        "$timestamp_min": timestamp_min,
+        "$timestamp_max": timestamp_max
+    }
 
     # Perform query and raise HTTP exception if any error occurs
-    result = json.loads(dgraph_client.query(preprocessing.add_default_attributes(query)))
-    return {"response": result["connections_search"]}
+    result = await dgraph_client.query(_CONNECTIONS_SEARCH_QUERY, variables)
+    # Response is returned as obtained from Dgraph without any processing
+    return block_response(result, "connections_search")
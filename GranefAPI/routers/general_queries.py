@@ -28,7 +28,7 @@ Contains custom queries that do not fall into any of the specific categories.
 """
 
 # Common Python modules
-import json
+import orjson
 
 # FastAPI modules
 from fastapi import APIRouter
@@ -38,19 +38,54 @@ from fastapi import HTTPException
 from models import query_models
 from utilities import preprocessing
 from utilities.dgraph_client import DgraphClient
+from utilities.query_cache import QueryCache
+from .overview_queries import warm_hosts_info
 
 
 # Initialize FastAPI router
 router = APIRouter()
 
+# Shared Dgraph client (singleton connected at the application start)
+dgraph_client = DgraphClient()
+
 
 @router.post("/custom_query",
     response_model=query_models.GeneralResponseDict,
     summary="Universal function allowing to define a custom query using Dgraph Query Language")
-def custom_query(request: query_models.CustomQuery) -> dict:
+async def custom_query(request: query_models.CustomQuery) -> dict:
     """
     See examples of Dgraph Query Language (DQL) at https://dgraph.io/docs/query-language/graphql-fundamentals/.
     """
-    dgraph_client = DgraphClient()
-    result = dgraph_client.query(preprocessing.add_default_attributes(request.query))
-    return {"response": json.loads(result)}
+    result = await dgraph_client.query(preprocessing.add_default_attributes(request.query))
+    return {"response": orjson.loads(result)}
+
+
+@router.get("/cache/stats",
+    response_model=query_models.GeneralResponseDict,
+    summary="Get statistics of the query responses cache")
+def cache_stats() -> dict:
+    """
+    Number of cached query responses, cache size and time-to-live, and number of cache hits and misses.
+    """
+    return {"response": QueryCache().stats()}
+
+
+@router.post("/cache/clear",
+    response_model=query_models.GeneralResponseDict,
+    summary="Remove all cached query responses")
+def cache_clear() -> dict:
+    """
+    Call this function if the Dgraph database content was changed to avoid outdated cached responses.
+    """
+    QueryCache().clear()
+    return {"response": QueryCache().stats()}
+
+
+@router.post("/cache/warm",
+    response_model=query_models.GeneralResponseDict,
+    summary="Cache hosts information of given network ranges")
+async def cache_warm(request: query_models.AddressQuery) -> dict:
+    """
+    Perform hosts_info query for each given network range (comma separated) to serve the following requests from the cache.
+    """
+    return {"response": await warm_hosts_info([address.strip() for address in request.address.split(",")])}
@@ -25,8 +25,9 @@ Definition of queries providing an interactivity for graph analysis.
 """
 
 # Common Python modules
-import json
-from typing import List
+import functools
+import orjson
+from operator import itemgetter
 
 # FastAPI modules
 from fastapi import APIRouter
@@ -36,33 +37,142 @@ from fastapi import HTTPException
 from models import query_models
 from utilities import validation, preprocessing
 from utilities.dgraph_client import DgraphClient
+from utilities.query_cache import cached_query
+from utilities.batcher import QueryBatcher
+from utilities.dgraph_schema import DgraphSchema
+from utilities.responses import block_response
 
 
 # Initialize FastAPI router
 router = APIRouter()
 
+# Shared Dgraph client (singleton connected at the application start)
+dgraph_client = DgraphClient()
+
+
+# Query templates of the router endpoints. User values are passed as Dgraph query variables, str.format is
+# used only for predicate and type names that cannot be expressed as variables. Static queries are extended
+# by default attributes only once at import, the formatted ones once per distinct query by cached builders.
+_FILTER_UIDS_BLOCK = """(func: uid($uids)) @filter({type_filter}) {{
+    uid
+}}"""
+
+_NODE_ATTRIBUTES_BLOCK = preprocessing.add_default_attributes("""(func: uid($uids)) {
+    expand(_all_)
+}""")
+
+_ATTRIBUTE_SEARCH_QUERY = """query attribute_search($value: string, $first: int, $offset: int) {{
+    attribute_search(func: {root}, first: $first, offset: $offset){value_filter} {{
+        {predicates}
+    }}
+}}"""
+
+_UIDS_TIME_RANGE_QUERY = """query uids_time_range($uids: string) {
+    var(func: uid($uids)) @filter(has(FlowRec.first_ts)) {
+        first_ts as FlowRec.first_ts
+        last_ts as FlowRec.last_ts
+    }
+    uids_time_range() {
+        connection.ts.min: min(val(first_ts))
+        connection.ts.max: max(val(last_ts))
+    }
+}"""
+
+_UIDS_TIMESTAMP_FILTER_QUERY = """query uids_timestamp_filter($uids: string, $timestamp_min: string, $timestamp_max: string) {
+    uids_timestamp_filter(func: uid($uids)) @filter(ge(FlowRec.last_ts, $timestamp_min) and le(FlowRec.first_ts, $timestamp_max)) {
+        uid
+    }
+}"""
+
+_NEIGHBORS_QUERY = """query neighbors($uids: string) {{
+    neighbors(func: uid($uids)) {{
+        expand(_all_) @filter({neighbor_filter}) {{
+            expand({types})
+        }}
+    }}
+}}"""
+
+
+@functools.lru_cache(maxsize=256)
+def _build_type_filter(types: str) -> str:
+    """Validate given types and build Dgraph filter selecting nodes of any of them.
+
+    Args:
+        types (str): Comma separated list of types, e.g. "Host, FlowRec".
+
+    Raises:
+        HTTPException (status 400): Given types are not valid type names.
+
+    Returns:
+        str: Filter of the sorted types, e.g. "type(FlowRec) or type(Host)".
+    """
+    validation.validate(types, "types")
+    return " or ".join("type(" + name + ")" for name in preprocessing.type_names(types))
+
+
+@functools.lru_cache(maxsize=256)
+def _build_attribute_search_query(attribute: str, predicates: tuple, indexed: bool) -> str:
+    """Build attribute_search query extended by default attributes.
+
+    Args:
+        attribute (str): Searched attribute, e.g. "FlowRec.protocol".
+        predicates (tuple): Value predicates to return, expand(_all_) is used if empty.
+        indexed (bool): The attribute can be searched by eq() function at query root.
+
+    Returns:
+        str: Query with $value, $first, and $offset variables.
+    """
+    # Search the value by index at query root if available, otherwise filter all nodes with the attribute
+    if indexed:
+        root, value_filter = "eq({0}, $value)".format(attribute), ""
+    else:
+        root, value_filter = "has({0})".format(attribute), " @filter(eq({0}, $value))".format(attribute)
+    query = _ATTRIBUTE_SEARCH_QUERY.format(root=root, value_filter=value_filter, predicates=" ".join(predicates) or "expand(_all_)")
+    return preprocessing.add_default_attributes(query)
+
+
+@functools.lru_cache(maxsize=256)
+def _build_neighbors_query(types: str) -> str:
+    """Validate given types and build neighbors query extended by default attributes.
+
+    Args:
+        types (str): Comma separated list of neighbor types, e.g. "Host, FlowRec". Any typed neighbor is selected if empty.
+
+    Raises:
+        HTTPException (status 400): Given types are not valid type names.
+
+    Returns:
+        str: Query with $uids variable.
+    """
+    # If the "types" request value is not specified, use "_all_" in expand() function and select any typed neighbor
+    if types:
+        # Validate types and raise exception if not valid
+        neighbor_filter = _build_type_filter(types)
+        expand_types = ", ".join(preprocessing.type_names(types))
+    else:
+        expand_types = "_all_"
+        neighbor_filter = "has(dgraph.type)"
+
+    # Neighbors without the required dgraph.type are removed by the filter directly in Dgraph
+    query = _NEIGHBORS_QUERY.format(types=expand_types, neighbor_filter=neighbor_filter)
+    return preprocessing.add_default_attributes(query)
+
 
 @router.post("/filter_uids",
     response_model=query_models.GeneralResponseList,
     summary="Filter given list of uids with defined types")
-def filter_uids(request: query_models.UidsTypesQuery) -> dict:
+async def filter_uids(request: query_models.UidsTypesQuery) -> dict:
     """
     Selection of uids of defined node type.
     """
-    dgraph_client = DgraphClient()
+    # Validate types and raise exception if not valid
+    block = _FILTER_UIDS_BLOCK.format(type_filter=_build_type_filter(request.types))
 
-    type_filter = "type(" + request.types.replace(",", ") or type(") + ")"
-    query = f"""{{
-        filterUids(func: uid({request.uids})) @filter({type_filter}) {{
-            uid
-        }} 
-    }}"""
-
-    # Perform query and raise HTTP exception if any error occurs
-    result = json.loads(dgraph_client.query(query))
+    # Perform query together with other concurrent requests and raise HTTP exception if any error occurs
+    result = await QueryBatcher().submit(block, {"$uids": preprocessing.uids_variable(request.uids)})
 
     # Extract uids
-    uids = [x["uid"] for x in result["filterUids"]]
+    uids = [x["uid"] for x in result]
 
     return {"response": uids}
 
@@ -70,126 +180,97 @@ def filter_uids(request: query_models.UidsTypesQuery) -> dict:
 @router.post("/node_attributes",
     response_model=query_models.GeneralResponseList, 
     summary="Get all node attributes for given nodes uid")
-def node_attributes(request: query_models.UidsQuery) -> dict:
+async def node_attributes(request: query_models.UidsQuery) -> dict:
     """
     Get all node attributes for given nodes uid (separated by comma).
     """
-    dgraph_client = DgraphClient()
-
-    query = f"""{{
-        node_attributes(func: uid({request.uids})) {{
-            expand(_all_)
-        }} 
-    }}"""
-
-    # Perform query and raise HTTP exception if any error occurs
-    result = json.loads(dgraph_client.query(preprocessing.add_default_attributes(query)))
-    return {"response": result["node_attributes"]}
+    # Perform query together with other concurrent requests and raise HTTP exception if any error occurs
+    result = await QueryBatcher().submit(_NODE_ATTRIBUTES_BLOCK, {"$uids": preprocessing.uids_variable(request.uids)})
+    return {"response": result}
 
 
 @router.post("/attribute_search",
     response_model=query_models.GeneralResponseList, 
     summary="Search nodes with a given attribute and value")
-def attribute_search(request: query_models.AttributeValueQuery) -> dict:
+async def attribute_search(request: query_models.AttributeValueQuery) -> dict:
     """
-    Get all nodes containing the given attribute and value (wide range query that sometimes takes too long).
+    Get nodes containing the given attribute and value (wide range query that sometimes takes too long).
+    Results are paginated by "limit" (default 500) and "offset" values.
     """
-    dgraph_client = DgraphClient()
-
-    query = f"""{{
-        attribute_search(func: has({request.attribute})) @filter(eq({request.attribute}, "{request.value}")) {{
-            expand(_all_)
-        }} 
-    }}"""
+    # Validate the attribute name as it is a part of the query and raise exception if not valid
+    validation.validate(request.attribute, "predicate")
+    if request.value is None:
+        raise HTTPException(
+            status_code = 400,
+            detail = "Searched value is not specified."
+        )
+
+    # Select value predicates of the attribute type (e.g. Host for Host.ip) directly if the type is known
+    schema = DgraphSchema()
+    predicates = tuple(schema.value_predicates(request.attribute.split(".")[0]))
+    query = _build_attribute_search_query(request.attribute, predicates, schema.is_eq_indexed(request.attribute))
+    variables = {"$value": request.value, "$first": str(request.limit), "$offset": str(request.offset or 0)}
 
     # Perform query and raise HTTP exception if any error occurs
-    result = json.loads(dgraph_client.query(preprocessing.add_default_attributes(query)))
-    return {"response": result["attribute_search"]}
+    result = await cached_query(query, variables)
+    # Response is returned as obtained from Dgraph without any processing
+    return block_response(result, "attribute_search")
 
 
 @router.post("/uids_time_range",
     response_model=query_models.GeneralResponseDict,
     summary="Return minimal and maximal timestamps for given uids")
-def uids_time_range(request: query_models.UidsQuery) -> dict:
+async def uids_time_range(request: query_models.UidsQuery) -> dict:
     """
     Get min and max connection.ts for a given list of uids (comma separated). Return null values if no uid with connection.ts attribute was found.
     """
-    dgraph_client = DgraphClient()
-
-    query = f"""{{
-        var(func: uid({request.uids})) {{
-		    first_ts as FlowRec.first_ts
-            last_ts as FlowRec.last_ts
-        }}
-        uids_time_range() {{
-		    connection.ts.min: min(val(first_ts))
-            connection.ts.max: max(val(last_ts))
-        }}
-    }}"""
-
     # Perform query and raise HTTP exception if any error occurs
-    result = json.loads(dgraph_client.query(query))
-    # Merge results (provided as list of dictionaries) into one dictionary
-    timestamps = {**result["uids_time_range"][0], **result["uids_time_range"][1]}
+    result = orjson.loads(await cached_query(_UIDS_TIME_RANGE_QUERY, {"$uids": preprocessing.uids_variable(request.uids)}))
+    # Dgraph returns each aggregation of the block as a separate object, merge them in a single pass
+    timestamps = {}
+    for aggregation in result["uids_time_range"]:
+        timestamps.update(aggregation)
     return {"response": timestamps}
 
 
 @router.post("/uids_timestamp_filter",
     response_model=query_models.GeneralResponseDict,
     summary="Filter given uids and return only those in the given time range")
-def uids_time_filter(request: query_models.UidsTimestampsRangeQuery) -> dict:
+async def uids_time_filter(request: query_models.UidsTimestampsRangeQuery) -> dict:
     """
     Select uids from the given list of uids (comma separated) that match the given timestamp range. Return empty array if no uid match the timestamp range.
     """
-    dgraph_client = DgraphClient()
-
-    query = f"""{{
-        uids_timestamp_filter(func: uid({request.uids})) @filter(ge(FlowRec.last_ts, "{request.timestamp_min}") and le(FlowRec.first_ts, "{request.timestamp_max}")) {{
-		    uid
-        }}
-    }}"""
+    variables = {
+        "$uids": preprocessing.uids_variable(request.uids),
+        "$timestamp_min": request.timestamp_min,
+        "$timestamp_max": request.timestamp_max
+    }
 
     # Perform query and raise HTTP exception if any error occurs
-    result = json.loads(dgraph_client.query(query))
+    result = orjson.loads(await dgraph_client.query(_UIDS_TIMESTAMP_FILTER_QUERY, variables))
     # Merge uid values (dicts in list) to list
-    uids = {"uids": [d["uid"] for d in result["uids_timestamp_filter"]]}
-    return {"response": uids}
+    return {"response": {"uids": list(map(itemgetter("uid"), result["uids_timestamp_filter"]))}}
 
 
 @router.post("/neighbors",
     response_model=query_models.GeneralResponseList,
     summary="Return all details for neighbor nodes of a given type for a given set of uids")
-def neighbors(request: query_models.UidsTypesQuery) -> dict:
+async def neighbors(request: query_models.UidsTypesQuery) -> dict:
     """
     Get all attributes for a given set of uids and their neighbors of a specified type defined in database schema (comma separated).
     If "types" attribute is not specified (or is empty), than the function returns all nodes regardless of their type.
     """
-    # If the "types" request value is not specified, use "_all_" in expand() function
-    types = request.types if request.types else "_all_"
-
-    dgraph_client = DgraphClient()
-
-    query = f"""{{
-        neighbors(func: uid({request.uids})) {{
-            expand(_all_) {{
-                expand({types})
-            }}
-        }}
-    }}"""
+    # Validate types and raise exception if not valid
+    query = _build_neighbors_query(request.types or "")
 
     # Perform query and raise HTTP exception if any error occurs
-    result = json.loads(dgraph_client.query(preprocessing.add_default_attributes(query)))
-
-    # Remove neighbors that were not expanded (doesn't have the required dgraph.type)
-    neighbors = []
-    for uid_result in result["neighbors"]:
-        uid_result_reduced = {"uid": uid_result["uid"], "dgraph.type": uid_result["dgraph.type"]}
-        # Do not select any attribute values for the parent node
-        for attribute, value in uid_result.items():
-            if isinstance(value, List) and attribute != "dgraph.type":
-                value[:] = [x for x in value if len(x) > 2 ]
-                if len(value) > 0:
-                    uid_result_reduced[attribute] = value
-        neighbors.append(uid_result_reduced)
+    result = orjson.loads(await dgraph_client.query(query, {"$uids": preprocessing.uids_variable(request.uids)}))
+
+    # Do not select any attribute values for the parent node, keep only its uid, type, and non-empty edges
+    neighbors = [
+        {attribute: value for attribute, value in uid_result.items()
+            if attribute in ("uid", "dgraph.type") or (isinstance(value, list) and value)}
+        for uid_result in result["neighbors"]
+    ]
 
     return {"response": neighbors}
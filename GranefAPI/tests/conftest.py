@@ -0,0 +1,5 @@
+# Make GranefAPI modules importable as in the application (e.g. "from utilities import ...")
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,18 @@
+import orjson
+
+from utilities.responses import block_response
+
+
+def test_block_response_splices_single_block():
+    response = orjson.dumps({"blk": [{"uid": "0x1", "name": "a\"],\"x\":[\\", "conn": [{"uid": "0x2"}]}]})
+    assert block_response(response, "blk").body == b'{"response":' + response[len(b'{"blk":'):-1] + b"}"
+
+
+def test_block_response_ignores_other_keys():
+    for extra in ({"x": 1}, {"x": [1, {"y": "]"}]}, {"x": {"blk": []}}):
+        response = orjson.dumps({"blk": [{"uid": "0x1", "dgraph.type": ["Host"]}], **extra})
+        assert orjson.loads(block_response(response, "blk").body) == {"response": [{"uid": "0x1", "dgraph.type": ["Host"]}]}
+
+
+def test_block_response_without_block():
+    assert orjson.loads(block_response(b'{"other":[]}', "blk").body) == {"response": []}
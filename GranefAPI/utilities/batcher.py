@@ -0,0 +1,139 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Granef -- graph-based network forensics toolkit
+# Copyright (C) 2020-2021  Milan Cermak, Institute of Computer Science of Masaryk University
+# Copyright (C) 2020-2021  Denisa Sramkova, Institute of Computer Science of Masaryk University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+"""
+Coalescing of concurrent single-block queries into one Dgraph query.
+
+Query blocks submitted within a short time window are named q0, q1, ... and sent to Dgraph as one
+query. The response is then split back to the individual callers. The window length and the maximal
+number of blocks in one query can be set by GRANEF_BATCH_MS and GRANEF_BATCH_MAX environment variables.
+Query variables of each block are prefixed by the block name to keep them unique within the batch.
+"""
+
+# Common Python modules
+import asyncio
+import orjson
+import os
+import re
+
+# GranefAPI
+from utilities.dgraph_client import SingletonMeta, DgraphClient, is_query_error
+from utilities.query_cache import QueryCache, query_key
+
+
+class QueryBatcher(metaclass=SingletonMeta):
+    """Collector of query blocks that are performed together as a single Dgraph query.
+
+    Available as a singleton so blocks from all routers can share one query.
+    """
+    batch_ms = int(os.environ.get("GRANEF_BATCH_MS", 10))  # Time window to collect blocks (in milliseconds)
+    batch_max = int(os.environ.get("GRANEF_BATCH_MAX", 32))  # Maximal number of blocks in one query
+
+    def __init__(self):
+        self.__pending = []
+        self.__timer = None
+        self.__tasks = set()  # Running batch tasks (referenced so they are not garbage collected)
+
+
+    async def submit(self, block: str, variables: dict = None) -> list:
+        """Add the query block to the next batch and wait for its result.
+
+        Args:
+            block (str): Query block without its name, e.g. "(func: uid($uids)) { uid }".
+            variables (dict, optional): Dictionary of string variables used in the block, e.g. {"$uids": "[0x1]"}. Defaults to None.
+
+        Raises:
+            HTTPException (status: 503): Database is not connected.
+            HTTPException (status: 500): The query transaction failed.
+
+        Returns:
+            list: Result of the given query block.
+        """
+        # Blocks are cached separately as the whole batch is unlikely to repeat, the result is stored as JSON bytes
+        # so each caller obtains its own copy
+        query_cache = QueryCache()
+        key = query_key(block, variables)
+        response = query_cache.get(key)
+        if response is not None:
+            return orjson.loads(response)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.__pending.append((block, variables or {}, future))
+
+        if len(self.__pending) >= self.batch_max:
+            self.__flush()
+        elif self.__timer is None:
+            self.__timer = loop.call_later(self.batch_ms / 1000, self.__flush)
+
+        result = await future
+        query_cache.set(key, orjson.dumps(result))
+        return result
+
+
+    def __flush(self) -> None:
+        """Take all pending blocks and perform them as one query in a separate task.
+        """
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        batch, self.__pending = self.__pending, []
+        if batch:
+            task = asyncio.ensure_future(self.__perform(batch))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+
+    async def __perform(self, batch: list) -> None:
+        """Perform the batch query and set the result of each block to its waiting caller.
+
+        If the batch query fails, blocks are performed one by one so an invalid block does not fail the others.
+        Errors of the database connection (not connected or unavailable database) are set to all blocks at once.
+
+        Args:
+            batch (list): List of (block, variables, future) tuples.
+        """
+        blocks, query_variables = [], {}
+        for i, (block, variables, _) in enumerate(batch):
+            for name, value in variables.items():
+                renamed = "$q{0}_{1}".format(i, name[1:])
+                block = re.sub(re.escape(name) + r"\b", renamed, block)
+                query_variables[renamed] = value
+            blocks.append("q{0}{1}".format(i, block))
+
+        header = ", ".join("{0}: string".format(name) for name in query_variables)
+        query = "query batch(" + header + ") {" + " ".join(blocks) + "}" if header else "{" + " ".join(blocks) + "}"
+        try:
+            result = orjson.loads(await DgraphClient().query(query, query_variables or None))
+        except Exception as e:
+            if len(batch) > 1 and is_query_error(e):
+                await asyncio.gather(*(self.__perform([single]) for single in batch))
+                return
+            for _, _, future in batch:
+                if not future.cancelled():
+                    future.set_exception(e)
+            return
+
+        for i, (_, _, future) in enumerate(batch):
+            if not future.cancelled():
+                future.set_result(result.get("q{0}".format(i), []))
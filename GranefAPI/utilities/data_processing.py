@@ -5,8 +5,57 @@
 Custom functions to ease data processing in Granef API.
 """
 
+import functools
+import math
 import re
-import networkx as nx  # Graph creation and manipulation
+
+
+# Precompiled patterns used to process queries
+_LINE_BREAKS = re.compile("\n|\r|\t")
+_SPACES = re.compile(" +")
+_BRACE_SPLIT = re.compile("{ *")
+
+# Background and border colors of nodes according to their type (shared by all nodes of the type)
+_GRAY_COLORS = {"background": "#f5f5f5", "border": "#666666"}
+_BLUE_COLORS = {"background": "#dae8fc", "border": "#6c8ebf"}
+_NODE_COLORS = {
+    "Host": {"background": "#d5e8d4", "border": "#82b366"},  # Green
+    "Connection": {"background": "#ffe6cc", "border": "#d79b00"},  # Orange
+    "File": _GRAY_COLORS,
+    "User_Agent": _GRAY_COLORS,
+    "Hostname": _GRAY_COLORS,
+    "X509": _GRAY_COLORS,
+    "Ioc": _BLUE_COLORS,
+    "Misp": _BLUE_COLORS
+}
+_DEFAULT_COLORS = {"background": "#f8cecc", "border": "#b85450"}  # Red as default color
+
+# Distance between neighboring nodes of the circle layout
+_CIRCLE_SPACING = 40
+
+
+@functools.lru_cache(maxsize=64)
+def _attribute_pattern(attribute: str) -> re.Pattern:
+    """
+    Get compiled pattern matching the given attribute name in a query part.
+
+    :param attribute: Name of the attribute.
+    :return: Compiled pattern matching the attribute at the start of the part or after a space.
+    """
+    return re.compile("(^| ){0} ".format(re.escape(attribute)))
+
+
+def _circle_layout(uids: list) -> dict:
+    """
+    Compute positions of nodes placed evenly on a circle with radius growing with the number of nodes.
+
+    :param uids: List of node uids in the order of their placement.
+    :return: Dictionary of (x, y) coordinates by node uid.
+    """
+    count = len(uids)
+    radius = _CIRCLE_SPACING * count / (2 * math.pi)
+    step = 2 * math.pi / count if count else 0
+    return {uid: (radius * math.cos(i * step), radius * math.sin(i * step)) for i, uid in enumerate(uids)}
 
 
 class DgraphDataProcessing:
@@ -14,24 +63,25 @@ class DgraphDataProcessing:
     Input and output data processing allowing to process data according to given query type
     and visualization format requirements.
 
+    Instances keep only the configuration, response graph is built in local structures of each call,
+    so one instance can be shared by concurrent requests.
+
     :param type: Type of the query response format (should be "json" or "graph").
-    :param layout: Layout format if "graph" query type is specified ("dot", "twopi", "fdp", "sfdp", "circo").
+    :param layout: Layout format if "graph" query type is specified ("circle" or graphviz "dot", "twopi", "fdp", "sfdp", "circo").
     :ivar __type: Requested query type.
     :ivar __layout: Requseted graph layout.
-    :ivar __graph: Structure to store response as NetworkX graph.
     """
     __type: str = ""
     __layout: str = ""
-    __graph: object = None
 
 
     def __init__(self, type: str, layout: str) -> None:
         self.__type = type
         # Set default layout if no layout is specified
-        self.__layout = layout if layout else "sfdp"
+        self.__layout = layout if layout else "circle"
     
 
-    def process_query(self, query: str, attributes: [str] = ["uid", "dgraph.type"]) -> str:
+    def process_query(self, query: str, attributes: tuple = ("uid", "dgraph.type")) -> str:
         """
         Transform query according to the requirements specified by a type of the query.
         
@@ -39,7 +89,7 @@ class DgraphDataProcessing:
         by specified attributes for each node.
 
         :param query: Dgraph query to process.
-        :param attributes: List of attributes that should be added to the each query node if they are not present.
+        :param attributes: Attributes that should be added to the each query node if they are not present.
         :return: Query transformed according to the requirements specified by a type of the query.
         """
         # Save original query
@@ -48,18 +98,19 @@ class DgraphDataProcessing:
         # If the response output should be graph, we need to add additional attributes 
         if self.__type == "graph":
             # Remove line endings and reduce spaces
-            reduced_query = re.sub(" +", " ", re.sub("\n|\r|\t", "", processed_query))
+            reduced_query = _SPACES.sub(" ", _LINE_BREAKS.sub("", processed_query))
 
             # Process query parts
-            parts = re.split("{ *", reduced_query)
+            patterns = [(attribute, _attribute_pattern(attribute)) for attribute in attributes]
+            parts = _BRACE_SPLIT.split(reduced_query)
             for i, part in enumerate(parts):
                 # Skip non attribute parts
                 if (not part) or part.isspace() or ("func:" in part):
                     continue
                 # Check if given attributes are specified and append missing ones
                 append = ""
-                for attribute in attributes:        
-                    if not bool(re.search('(^| ){0} '.format(attribute), part)):
+                for attribute, pattern in patterns:
+                    if not pattern.search(part):
                         append = append + '{0} '.format(attribute)
                 parts[i] = append + part    
 
@@ -69,90 +120,86 @@ class DgraphDataProcessing:
         return processed_query
     
 
-    def __get_node_colors(self, node_type: str) -> dict:
+    def __process_response_node(self, nodes: dict, edges: dict, node: dict, fixed: bool = False) -> None:
         """
-        Returns dictionary with background and border color for a node according to the node type.
+        Transform the response node and all its descendants and append them to graph nodes and edges.
 
-        Example of the return value {"background": "#d5e8d4", "border": "#82b366"}
+        Nodes are processed iteratively using an explicit stack, so deep responses are not limited by the recursion limit.
+        Nodes and edges are added in the same order as by depth-first recursion over the response.
 
-        :param node_type: Type of the node (typically dgprah.type attribute).
-        :return: Dictionary with background and border color definition.
-        """
-        if node_type == "Host":
-            # Green
-            return {"background": "#d5e8d4", "border": "#82b366"}
-        elif node_type == "Connection":
-            # Orange
-            return {"background": "#ffe6cc", "border": "#d79b00"}
-        elif node_type == "File" or node_type == "User_Agent" or node_type == "Hostname" or node_type == "X509":
-            # Gray
-            return {"background": "#f5f5f5", "border": "#666666"}
-        elif node_type == "Ioc" or node_type == "Misp":
-            # Blue
-            return {"background": "#dae8fc", "border": "#6c8ebf"}
-        else: 
-            # Red as default color
-            return {"background": "#f8cecc", "border": "#b85450"}
-
-
-    def __process_response_node(self, node: dict, fixed: bool = False) -> None:
-        """
-        Recursive method to iteratively transform all response nodes and append them to NetworkX graph object.
-
-        :param node: Currently processed response node.
+        :param nodes: Attributes of graph nodes by their uid.
+        :param edges: Names of graph edges by their target uid, grouped by the source uid.
+        :param node: Response node to process.
         :param fixed: Bool value to indicate if node attribute "fixed" should be set to given value (used for visualization).
-        :param layer: Indicator of the node layer.
         """
-        self.__graph.add_node(node["uid"])
-        self.__graph.nodes[node["uid"]]["fixed"] = fixed
-
-        # Process node according to it type
-        for key, value in node.items():
-            if not isinstance(value, list):  # General attribute
-                self.__graph.nodes[node["uid"]][key] = value
-            elif not isinstance(value[0], dict):  # Attribute with and array of results
-                if len(value) == 1:
-                    self.__graph.nodes[node["uid"]][key] = value
-                else:
-                    self.__graph.nodes[node["uid"]][key] = "<br>"+'<br>'.join(value)
-            else:  # Edge
-                for next_node in value:
-                    self.__graph.add_edge(node["uid"], next_node["uid"], name=key)
-                    self.__process_response_node(next_node)       
-
-
-    def __graph_to_dict(self) -> dict:
+        stack = [(node, fixed, None, None)]
+        while stack:
+            node, fixed, parent_uid, edge_name = stack.pop()
+            uid = node["uid"]
+            # Add the edge from the parent just before the node is visited, as it was added before the recursive call
+            if parent_uid is not None:
+                edges[parent_uid][uid] = edge_name
+            attributes = nodes.setdefault(uid, {})
+            attributes["fixed"] = fixed
+            edges.setdefault(uid, {})
+            next_nodes = []
+
+            # Process node according to it type
+            for key, value in node.items():
+                if not isinstance(value, list):  # General attribute
+                    attributes[key] = value
+                elif not isinstance(value[0], dict):  # Attribute with and array of results
+                    if len(value) == 1:
+                        attributes[key] = value
+                    else:
+                        attributes[key] = "<br>"+'<br>'.join(value)
+                else:  # Edge
+                    for next_node in value:
+                        next_nodes.append((next_node, False, uid, key))
+
+            # Push descendants in reverse, so they are visited in the response order (depth-first pre-order)
+            stack.extend(reversed(next_nodes))
+
+
+    def __graph_to_dict(self, nodes: dict, edges: dict) -> dict:
         """
-        Transformation of the NetworkX graph object to the dictionary in the format requested by the results
+        Transformation of the graph nodes and edges to the dictionary in the format requested by the results
         visualization method (see details at https://visjs.github.io/vis-network/docs/network/).
 
-        The method allows to set nodes layout using the graphviz tool. For more details see
+        Nodes are placed on a circle by default, their final position is left to the physics of the visualization.
+        Other layouts are computed using the graphviz tool. For more details see
         https://networkx.github.io/documentation/stable/reference/generated/networkx.drawing.nx_pydot.graphviz_layout.html.
 
+        :param nodes: Attributes of graph nodes by their uid.
+        :param edges: Names of graph edges by their target uid, grouped by the source uid.
         :return: Graph in dictionary format with attributes required by the visualization.
         """
-        # Set layout
-        layout = nx.nx_agraph.graphviz_layout(self.__graph, prog=self.__layout)
-        #layout = nx.spring_layout(self.__graph)
+        # Set layout (NetworkX is imported and its graph created only as the graphviz layout input)
+        if self.__layout == "circle":
+            layout = _circle_layout(list(nodes))
+        else:
+            import networkx as nx
+            graph = nx.DiGraph()
+            graph.add_nodes_from(nodes)
+            graph.add_edges_from((source, target) for source, targets in edges.items() for target in targets)
+            layout = nx.nx_agraph.graphviz_layout(graph, prog=self.__layout)
+
+        # Local aliases used for each node
+        get_colors = _NODE_COLORS.get
+        default_colors = _DEFAULT_COLORS
 
         # Generate data
-        graph_dict = {"nodes": [], "edges": []}
-        for graph_node in self.__graph.nodes(data=True):
-            # Create a new node
-            node = {}
-            node["id"] = graph_node[0]
-
-            # Set computed coordinates according to the layout (multiplication allow wider layout)
-            x, y = layout[graph_node[0]]
-            node["x"] = x * 5
-            node["y"] = y * 5
-
-            # Set default node lable to avoid animation overload
-            node["label"] = " "
+        graph_nodes = []
+        append_node = graph_nodes.append
+        for uid, attributes in nodes.items():
+            # Create a new node with computed coordinates according to the layout (multiplication allow wider layout)
+            # and default node lable to avoid animation overload
+            x, y = layout[uid]
+            node = {"id": uid, "x": x * 5, "y": y * 5, "label": " "}
 
             # Generare node attributes
-            title = ""
-            for key, value in graph_node[1].items():
+            title_parts = []
+            for key, value in attributes.items():
                 # Skip uid attribute as it is not necessary for visualization
                 if key == "uid":
                     continue
@@ -161,32 +208,26 @@ class DgraphDataProcessing:
                     node["label"] = value
                 # Set node collor according to its type
                 elif key == "dgraph.type":
-                    node["color"] = self.__get_node_colors(node_type=value[0])
+                    node["color"] = get_colors(value[0], default_colors)
                 # For strating nodes set fixed attribute to disable their animation
                 elif key == "fixed":
                     node["fixed"] = value
                 # Join any other attributes into one title field
                 else:
-                    title += "<b>{0}:</b> {1}<br>".format(key, value)
-
-            # Add created title to the node
-            if "title" in node:
-                node["title"] += title
-            else:
-                node["title"] = title
-
-            # Append created node to resulting dictionary
-            graph_dict["nodes"].append(node)
-
-        # Generate graph edges
-        for graph_edge in self.__graph.edges(data=True):
-            # Check the right edge direction
-            if graph_edge[2]["name"].startswith("~"):
-                edge = {"id": graph_edge[1]+"-"+graph_edge[0], "from": graph_edge[1], "to": graph_edge[0], "arrows": "to", "label": graph_edge[2]["name"]}
-            else:
-                edge = {"id": graph_edge[0]+"-"+graph_edge[1], "from": graph_edge[0], "to": graph_edge[1], "arrows": "to", "label": graph_edge[2]["name"]}
-            graph_dict["edges"].append(edge)
-        
+                    title_parts.append("<b>{0}:</b> {1}<br>".format(key, value))
+            node["title"] = "".join(title_parts)
+
+            # Append created node to resulting list
+            append_node(node)
+
+        # Generate graph edges in the right direction
+        graph_edges = [
+            {"id": target+"-"+source, "from": target, "to": source, "arrows": "to", "label": name} if name.startswith("~")
+            else {"id": source+"-"+target, "from": source, "to": target, "arrows": "to", "label": name}
+            for source, targets in edges.items() for target, name in targets.items()
+        ]
+
+        graph_dict = {"nodes": graph_nodes, "edges": graph_edges}
         return graph_dict
 
 
@@ -208,11 +249,11 @@ class DgraphDataProcessing:
             # Get result only for the first function
             data = list(response.values())[0]
             # Set graph and load data
-            self.__graph = nx.DiGraph()
+            nodes, edges = {}, {}
             for node in data:
                 # Set the first response nodes as fixed
-                self.__process_response_node(node, fixed=True)
+                self.__process_response_node(nodes, edges, node, fixed=True)
             # Convert created graph to dictionary for visualization
-            processed_response = self.__graph_to_dict()
+            processed_response = self.__graph_to_dict(nodes, edges)
 
         return processed_response
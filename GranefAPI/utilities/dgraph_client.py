@@ -26,13 +26,51 @@ Singleton class providing Dgraph connection for Granef API. The code is inspired
 available at https://refactoring.guru/design-patterns/singleton/python/example.
 """
 
+# Common Python modules
+import asyncio
+
 # FastAPI modules
 from fastapi import HTTPException
 
 # Official communication module for Dgraph database
+import grpc
 import pydgraph
 
 
+# Errors of a failed query (gRPC call errors and errors raised by pydgraph transactions)
+_QUERY_ERRORS = (
+    grpc.RpcError,
+    pydgraph.errors.AbortedError,
+    pydgraph.errors.ConnectionError,
+    pydgraph.errors.RetriableError,
+    pydgraph.errors.TransactionError
+)
+# gRPC status codes of calls failed due to unavailable or overloaded database (not due to the query itself)
+_UNAVAILABLE_CODES = frozenset((
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED
+))
+
+
+def is_query_error(error: Exception) -> bool:
+    """Check if the error of DgraphClient.query was caused by the query itself (e.g. an invalid query block).
+
+    Args:
+        error (Exception): Error raised by DgraphClient.query.
+
+    Returns:
+        bool: True if the query transaction failed, False if the database is not connected or unavailable.
+    """
+    if not isinstance(error, HTTPException) or error.status_code != 500:
+        return False
+    cause = error.__cause__
+    if isinstance(cause, (pydgraph.errors.ConnectionError, pydgraph.errors.RetriableError)):
+        return False
+    code = getattr(cause, "code", None)
+    return not (callable(code) and code() in _UNAVAILABLE_CODES)
+
+
 class SingletonMeta(type):
     """
     Meta class to provide singleton functionality.
@@ -51,32 +89,46 @@ class DgraphClient(metaclass=SingletonMeta):
 
     Available as a singleton to ease usage of initialized Dgraph connection.
     """
-    client_stub = None  # Pydgraph client variable to store connection details
+    client_stubs = []  # Pydgraph client stubs (one per gRPC channel) storing connection details
     dgraph = None  # Initialized Pydgraph client object.
+    max_concurrent_queries = 32  # Maximal number of queries performed in Dgraph at the same time
+    query_semaphore = None  # Semaphore limiting the number of concurrent queries
 
-    def connect(self, ip: str, port: int):
+    async def connect(self, ip: str, port: int, pool_size: int = 8):
         """Establish connection to Dgraph database server.
 
+        The asynchronous gRPC channels are bound to the running event loop, so the connection has to be
+        established within the loop serving the API (e.g., in the application startup event). Each query
+        transaction uses a randomly selected channel of the pool.
+
         Args:
             ip (str): IP address of the Dgraph server.
             port (int): Port of the Dgraph server.
+            pool_size (int, optional): Number of gRPC channels (TCP connections) to the server. Defaults to 8.
         
         Raises:
             ConnectionError: Connection was not established.
         """
         # Destroy previous Dgraph connection
-        if self.client_stub:
-            self.client_stub.close()
-
-        # Initialize dgraph server connection (set GRPC with maximum values)
-        self.client_stub = pydgraph.DgraphClientStub("{0}:{1}".format(ip, port), options=[
+        for client_stub in self.client_stubs:
+            await client_stub.close()
+
+        # Initialize dgraph server connections (set GRPC with maximum values, compress messages by gzip, and keep the
+        # channels alive between requests, local subchannel pool makes each channel use its own TCP connection).
+        # Keepalive pings are not sent more often than the gRPC server allows by default (once per 5 minutes),
+        # otherwise the server closes the connection by GOAWAY "too_many_pings" even during running queries.
+        self.client_stubs = [pydgraph.AsyncDgraphClientStub("{0}:{1}".format(ip, port), options=[
             ('grpc.max_send_message_length', 1024 * 1024 * 1024),
-            ('grpc.max_receive_message_length', 1024 * 1024 * 1024)
-        ])
-        self.dgraph = pydgraph.DgraphClient(self.client_stub)
+            ('grpc.max_receive_message_length', 1024 * 1024 * 1024),
+            ('grpc.default_compression_algorithm', int(grpc.Compression.Gzip)),
+            ('grpc.keepalive_time_ms', 300000),
+            ('grpc.use_local_subchannel_pool', 1)
+        ]) for _ in range(max(pool_size, 1))]
+        self.dgraph = pydgraph.AsyncDgraphClient(*self.client_stubs)
+        self.query_semaphore = asyncio.Semaphore(self.max_concurrent_queries)
 
 
-    def query(self, query: str, variables: dict = None) -> str:
+    async def query(self, query: str, variables: dict = None) -> bytes:
         """Perform given query and raise HTTPException if some error occurs.
 
         Args:
@@ -88,7 +140,7 @@ class DgraphClient(metaclass=SingletonMeta):
             HTTPException (status: 500): The query transaction failed.
 
         Returns:
-            str: Obtained response as a JSON string.
+            bytes: Obtained response as raw JSON bytes (ready for orjson.loads or to be passed through).
         """
         # Check if the database connection is initialized
         if not self.dgraph:
@@ -97,15 +149,18 @@ class DgraphClient(metaclass=SingletonMeta):
                 detail = "Dgraph database is not connected."
             )
 
-        try:
-            txn = self.dgraph.txn(read_only=True)
-            result = txn.query(query, variables)
-        except Exception as e:
-            raise HTTPException(
-                status_code = 500,
-                detail = "Dgraph query failed: " + str(e)
-            )
-        finally:
-            txn.discard()
+        async with self.query_semaphore:
+            # Best-effort read-only transaction uses the latest timestamp known to the server instead of
+            # requesting a new one, queries cannot perform mutations
+            txn = self.dgraph.txn(read_only=True, best_effort=True)
+            try:
+                result = await txn.query(query, variables=variables)
+            except _QUERY_ERRORS as e:
+                raise HTTPException(
+                    status_code = 500,
+                    detail = f"Dgraph query failed: {e}"
+                ) from e
+            finally:
+                await txn.discard()
 
         return result.json
@@ -0,0 +1,91 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Granef -- graph-based network forensics toolkit
+# Copyright (C) 2020-2021  Milan Cermak, Institute of Computer Science of Masaryk University
+# Copyright (C) 2020-2021  Denisa Sramkova, Institute of Computer Science of Masaryk University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+"""
+Dgraph schema of the connected database, loaded once after the connection is established.
+
+The schema allows to query explicit predicates of a known node type instead of expand(_all_), which
+has to look up predicates of each node type in the schema.
+"""
+
+# Common Python modules
+import orjson
+from typing import List
+
+# GranefAPI
+from utilities.dgraph_client import SingletonMeta, DgraphClient
+
+
+# Tokenizers of indexes supporting eq() function (other indexes, e.g. term, fulltext, trigram, or geo, do not)
+_EQ_TOKENIZERS = frozenset(("exact", "hash", "int", "float", "bool", "year", "month", "day", "hour"))
+
+
+class DgraphSchema(metaclass=SingletonMeta):
+    """Types and predicates defined in the Dgraph schema.
+
+    Available as a singleton so the schema is loaded only once for all routers.
+    """
+    type_predicates = {}  # Value (non-uid) predicates of each type listed in the schema
+    eq_indexed = set()  # Predicates with an index supporting eq() function at query root
+
+    async def load(self) -> None:
+        """Load types and their predicates from the connected database.
+
+        Raises:
+            HTTPException (status: 503): Database is not connected.
+            HTTPException (status: 500): The query transaction failed.
+        """
+        result = orjson.loads(await DgraphClient().query("schema {}"))
+        predicate_types = {predicate["predicate"]: predicate.get("type") for predicate in result.get("schema", [])}
+        self.type_predicates = {
+            dgraph_type["name"]: [field["name"] for field in dgraph_type.get("fields", []) if predicate_types.get(field["name"]) not in (None, "uid")]
+            for dgraph_type in result.get("types", [])
+        }
+        self.eq_indexed = {
+            predicate["predicate"] for predicate in result.get("schema", [])
+            if predicate.get("index") and _EQ_TOKENIZERS.intersection(predicate.get("tokenizer", []))
+        }
+
+
+    def value_predicates(self, dgraph_type: str) -> List[str]:
+        """Get value predicates of the given type, i.e. predicates returned by expand(_all_) without nested block.
+
+        Args:
+            dgraph_type (str): Name of the type.
+
+        Returns:
+            list[str]: Value predicates of the type or empty list if the type is not known.
+        """
+        return self.type_predicates.get(dgraph_type, [])
+
+
+    def is_eq_indexed(self, predicate: str) -> bool:
+        """Check if the predicate can be searched by eq() function at query root.
+
+        Args:
+            predicate (str): Name of the predicate.
+
+        Returns:
+            bool: True if the predicate has a suitable index, False otherwise or if the predicate is not known.
+        """
+        return predicate in self.eq_indexed
@@ -26,33 +26,122 @@ Custom functions to ease data processing in Granef API.
 """
 
 # Common Python modules
-import re
-from typing import List
+from typing import List, Tuple
 
 
-def add_default_attributes(query: str, attributes: List[str] = ["uid", "dgraph.type"]) -> str:
+# Characters removed from queries before adding default attributes
+_REMOVED_CHARACTERS = str.maketrans("", "", "\n\r\t")
+
+# Attributes added to each query node by default
+_DEFAULT_ATTRIBUTES = ("uid", "dgraph.type")
+
+
+def _attribute_searches(attributes: Tuple[str, ...]) -> List[tuple]:
+    """Prepare strings used to check presence of the attributes in a query node.
+
+    Args:
+        attributes (tuple[str]): Names of the attributes.
+
+    Returns:
+        list[tuple]: Text to prepend, prefixes, infix, and suffix for each attribute.
+    """
+    return [
+        (attribute + " ", (attribute + " ", attribute + "}"), " " + attribute + " ", " " + attribute + "}")
+        for attribute in attributes
+    ]
+
+
+# Checks of the default attributes prepared once at import
+_DEFAULT_SEARCHES = _attribute_searches(_DEFAULT_ATTRIBUTES)
+
+
+def _reduce_spaces(text: str) -> str:
+    """Replace each sequence of spaces in the text by a single space.
+
+    Args:
+        text (str): Text to process.
+
+    Returns:
+        str: Text without repeated spaces.
+    """
+    words = text.split(" ")
+    reduced = " ".join(filter(None, words))
+    if not reduced:
+        return " " if text else ""
+    return (" " if not words[0] else "") + reduced + (" " if not words[-1] else "")
+
+
+def add_default_attributes(query: str, attributes: Tuple[str, ...] = _DEFAULT_ATTRIBUTES) -> str:
     """Add specified attributes to all nodes of the query.
 
+    The query is processed by string methods only. An attribute is present in the node if it is preceded by
+    a space or the block start and followed by a space or the block end.
+
     Args:
         query (str): Dgraph query to process.
-        attributes (list[str], optional): List of attributes that should be added to the each query node if they are not present. Defaults to ["uid", "dgraph.type"].
+        attributes (tuple[str], optional): Attributes that should be added to the each query node if they are not present. Defaults to ("uid", "dgraph.type").
 
     Returns:
         str: Query transformed according to the requirements specified by a type of the query.
     """
     # Remove line endings and reduce spaces
-    reduced_query = re.sub(" +", " ", re.sub("\n|\r|\t", "", query))
+    reduced_query = _reduce_spaces(query.translate(_REMOVED_CHARACTERS))
 
-    # Process query parts
-    parts = re.split("{ *", reduced_query)
-    for i, part in enumerate(parts):
+    # Prefixes and infixes of each attribute present in the node
+    searches = _DEFAULT_SEARCHES if attributes is _DEFAULT_ATTRIBUTES else _attribute_searches(attributes)
+
+    # Process query parts, the header (text before the first block) is kept as is
+    parts = reduced_query.split("{")
+    for i in range(1, len(parts)):
+        # Spaces are reduced, so at most one space follows the brace
+        part = parts[i][1:] if parts[i].startswith(" ") else parts[i]
+        parts[i] = part
         # Skip non attribute parts
         if (not part) or part.isspace() or ("func:" in part):
             continue
-        # Check if given attributes are specified and append missing ones
-        append = ""
-        for attribute in attributes:        
-            if not bool(re.search('(^| ){0}( |}})'.format(attribute), part)):
-                append = append + '{0} '.format(attribute)
-        parts[i] = append + part
-    return "{".join(parts) 
+        # Check if given attributes are specified and prepend missing ones
+        missing = [append for append, prefixes, infix, suffix in searches
+            if not (part.startswith(prefixes) or infix in part or suffix in part)]
+        if missing:
+            parts[i] = "".join(missing) + part
+    return "{".join(parts)
+
+
+def type_names(types: str) -> List[str]:
+    """Split comma separated Dgraph types to a sorted list of unique names.
+
+    The sorting makes the resulting query independent of the order of given types.
+
+    Args:
+        types (str): Comma separated list of types, e.g. "Host, FlowRec".
+
+    Returns:
+        list[str]: Sorted list of unique type names, e.g. ["FlowRec", "Host"].
+    """
+    return sorted({name.strip() for name in types.split(",")})
+
+
+def canonical_uids(uids: str) -> str:
+    """Normalize comma separated uids to a sorted list without duplicates.
+
+    Equal sets of uids therefore result in the same query and share its cached response.
+
+    Args:
+        uids (str): Comma separated list of uids, e.g. "0x2, 0x1,0x2".
+
+    Returns:
+        str: Comma separated sorted unique uids, e.g. "0x1,0x2".
+    """
+    return ",".join(sorted({uid.strip() for uid in uids.split(",")} - {""}))
+
+
+def uids_variable(uids: str) -> str:
+    """Format comma separated uids as a value of the Dgraph query variable used in uid() function.
+
+    Args:
+        uids (str): Comma separated list of uids.
+
+    Returns:
+        str: List of uids enclosed in square brackets, e.g. "[0x1, 0x2]".
+    """
+    return "[" + uids + "]"
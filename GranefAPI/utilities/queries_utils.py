@@ -6,11 +6,11 @@ Definition of helper queries functions for Granef API.
 """
 
 # Common Python modules
+import functools
 import ipaddress
 import socket
 from datetime import datetime
-import json
-from typing import List
+import orjson
 
 # FastAPI modules
 from fastapi import HTTPException
@@ -20,64 +20,87 @@ from utilities.dgraph_client import DgraphClient
 from utilities.data_processing import DgraphDataProcessing
 
 
+# Format of datetime parameters
+_DATETIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+# List attributes of neighbors query nodes that are kept as they are (values, not neighbor nodes)
+_EXEMPT = frozenset({"dgraph.type", "hostname.type", "files.analyzers", "http.resp_mime_types", "notice.actions", "dns.answers"})
+
+# Attribute used as a label of graph nodes by the node type (type name is used for other types)
+_LABEL_ATTRIBUTES = {
+    "Connection": "connection.proto",
+    "Host": "host.ip",
+    "Dns": "dns.query",
+    "Hostname": "hostname.name",
+    "Files": "files.mime_type",
+    "File": "file.mime_type",
+    "Http": "http.hostname",
+    "User_Agent": "user_agent.name",
+    "Ioc": "ioc.value",
+    "Misp": "misp.info"
+}
+
+# Possible values of the checked enumerated parameters by their kind and corresponding error messages
+_ENUM_VALUES = {
+    "selected_count": frozenset({"obtained_file_count", "provided_file_count", "originated_count", "responded_count", "x509_count"}),
+    "port_type": frozenset({"resp_p", "orig_p"}),
+    "filter_func": frozenset({"eq", "ge", "le", "gt", "lt"}),
+    "ssh_attribute": frozenset({"auth_attempts", "version", "client"}),
+    "conn_attribute": frozenset({"proto", "conn_state", "duration", "orig_bytes", "orig_ip_bytes", "orig_p", "orig_pkts",
+        "resp_bytes", "resp_ip_bytes", "resp_p", "resp_pkts", "service", "ts"}),
+    "file_attribute": frozenset({"md5", "sha1"})
+}
+_ENUM_MESSAGES = {kind: "' is not one of " + ", ".join(sorted(values)) + "." for kind, values in _ENUM_VALUES.items()}
+
+
 def check_ip_address(param_name, param_val):
     try:
-        socket.inet_aton(param_val)
-    except socket.error:
-        raise_error("Parameter '" + param_name + "' is not valid IP address (CIDR not supported).")
+        socket.inet_pton(socket.AF_INET, param_val)
+    except (OSError, TypeError):
+        raise_error(f"Parameter '{param_name}' is not valid IP address (CIDR not supported).")
 
 
 def check_cidr(param_name, param_val):
     try:
         ipaddress.ip_network(param_val)
     except ValueError:
-        raise_error("Parameter '" + param_name + "' is not valid IP address in CIDR format.")
+        raise_error(f"Parameter '{param_name}' is not valid IP address in CIDR format.")
 
 
 def convert_to_datetime(param_name, param_val):
     try:
-        datetime_object = datetime.strptime(param_val, '%d/%m/%Y %H:%M:%S')
-        datetime_iso = str(datetime_object.isoformat())
-        return datetime_iso
-    except:
-        raise_error("Parameter '" + param_name + "' is expected to be in datetime '%m/%d/%y %H:%M:%S' format.")
+        return datetime.strptime(param_val, _DATETIME_FORMAT).isoformat()
+    except (TypeError, ValueError):
+        raise_error(f"Parameter '{param_name}' is expected to be in datetime '{_DATETIME_FORMAT}' format.")
+
+
+def check_enum(kind, param_name, param_val):
+    if param_val not in _ENUM_VALUES[kind]:
+        raise_error("Parameter '" + param_name + _ENUM_MESSAGES[kind])
 
 
 def check_selected_count(param_name, param_val):
-    possible_values = ["obtained_file_count", "provided_file_count", "originated_count", "responded_count", "x509_count"]
-    if param_val not in possible_values:
-        raise_error("Parameter '" + param_name + "' is not one of " + str(possible_values) + ".")
+    check_enum("selected_count", param_name, param_val)
 
 
 def check_port_type(param_name, param_val):
-    possible_values = ["resp_p", "orig_p"]
-    if param_val not in possible_values:
-        raise_error("Parameter '" + param_name + "' is not one of " + str(possible_values) + ".")
+    check_enum("port_type", param_name, param_val)
 
 
 def check_filter_func(param_name, param_val):
-    possible_values = ["eq", "ge", "le", "gt", "lt"]
-    if param_val not in possible_values:
-        raise_error("Parameter '" + param_name + "' is not one of " + str(possible_values) + ".")
+    check_enum("filter_func", param_name, param_val)
 
 
 def check_ssh_attribute(param_name, param_val):
-    possible_values = ["auth_attempts", "version", "client"]
-    if param_val not in possible_values:
-        raise_error("Parameter '" + param_name + "' is not one of " + str(possible_values) + ".")
+    check_enum("ssh_attribute", param_name, param_val)
 
 
 def check_conn_attribute(param_name, param_val):
-    possible_values = ["proto", "conn_state", "duration", "orig_bytes", "orig_ip_bytes", "orig_p", "orig_pkts", 
-    "resp_bytes", "resp_ip_bytes", "resp_p", "resp_pkts", "service", "ts"]
-    if param_val not in possible_values:
-        raise_error("Parameter '" + param_name + "' is not one of " + str(possible_values) + ".")
+    check_enum("conn_attribute", param_name, param_val)
 
 
 def check_file_attribute(param_name, param_val):
-    possible_values = ["md5", "sha1"]
-    if param_val not in possible_values:
-        raise_error("Parameter '" + param_name + "' is not one of " + str(possible_values) + ".")
+    check_enum("file_attribute", param_name, param_val)
 
 
 def raise_error(msg):
@@ -88,68 +111,68 @@ def raise_error(msg):
 
 
 def get_label(node):
-    print(node)
     node_type = node["dgraph.type"][0]
-    if node_type == "Connection":
-        return node.get("connection.proto", node_type)
-    elif node_type == "Host":
-        return node.get("host.ip", node_type)
-    elif node_type == "Dns":
-        return node.get("dns.query", node_type)
-    elif node_type == "Hostname":
-        return node.get("hostname.name", node_type)
-    elif node_type == "Files":
-        return node.get("files.mime_type", node_type)
-    elif node_type == "File":
-        return node.get("file.mime_type", node_type)
-    elif node_type == "Http":
-        return node.get("http.hostname", node_type)
-    elif node_type == "User_Agent":
-        return node.get("user_agent.name", node_type)
-    elif node_type == "Ioc":
-        return node.get("ioc.value", node_type)
-    elif node_type == "Misp":
-        return node.get("misp.info", node_type)
-    else:
-        return node_type
-
-
-def handle_query(query_body: str, query_header: str = "", variables: dict = None, type: str = "json", layout: str = "sfdp"):
+    return node.get(_LABEL_ATTRIBUTES[node_type], node_type) if node_type in _LABEL_ATTRIBUTES else node_type
+
+
+@functools.lru_cache(maxsize=16)
+def _get_processor(type, layout):
+    """
+    Get shared data processing instance for the given query type and layout.
+    """
+    return DgraphDataProcessing(type=type, layout=layout)
+
+
+def _hack_postprocess(result, type):
+    """
+    Remove neighbors that were not expanded (doesn't have the required dgraph.type) from the getAllNodeNeighbors result.
+    """
+    graph = type == "graph"
+    neighbors = []
+    for uid_result in result["getAllNodeNeighbors"]:
+        uid_result_reduced = {"uid": uid_result["uid"], "dgraph.type": uid_result["dgraph.type"]}
+        if graph:
+            uid_result_reduced["label"] = get_label(uid_result)
+        # Do not select any attribute values for the parent node
+        for attribute, value in uid_result.items():
+            if attribute in _EXEMPT or not isinstance(value, list):
+                uid_result_reduced[attribute] = value
+                continue
+            # Keep only expanded neighbors (with more than uid and dgraph.type attributes), labeled for graph
+            if graph:
+                expanded = [dict(value_node, label=get_label(value_node)) for value_node in value if len(value_node) > 2]
+            else:
+                expanded = [value_node for value_node in value if len(value_node) > 2]
+            if expanded:
+                uid_result_reduced[attribute] = expanded
+        neighbors.append(uid_result_reduced)
+    return {"getAllNodeNeighbors": neighbors}
+
+
+async def handle_query(query_body: str, query_header: str = "", variables: dict = None, type: str = "json", layout: str = "circle",
+        hack: bool = False):
     """
     General function to process a Dgraph query. Result is provided as a JSON response or 
-    extended by graph data according to desired query type.
+    extended by graph data according to desired query type. If hack is set, the getAllNodeNeighbors
+    result is reduced to expanded neighbors only.
     """
     dgraph_client = DgraphClient()
-    dgraph_processing = DgraphDataProcessing(type=type, layout=layout)
+    dgraph_processing = _get_processor(type, layout)
     processed_query_str = query_header + dgraph_processing.process_query(query_body)
 
-    # Perform query and raise HTTP exception if any error occures
+    # Perform query (database errors are raised as they are)
+    response = await dgraph_client.query(processed_query_str, variables)
+
+    # Raise HTTP exception if the response cannot be parsed or processed
     try:
-        # Preprocess query according to the query type
-        result = json.loads(dgraph_client.query(processed_query_str, variables))
+        result = orjson.loads(response)
+        if hack:
+            result = _hack_postprocess(result, type)
+        # Process response accoring to the query type
+        processed_response = dgraph_processing.process_response(response=result)
+    except HTTPException:
+        raise
     except Exception as e:
         raise_error(str(e))
 
-    if "hack" in variables:
-        # Remove neighbors that were not expanded (doesn't have the required dgraph.type)
-        neighbors = []
-        for uid_result in result["getAllNodeNeighbors"]:
-            uid_result_reduced = {"uid": uid_result["uid"], "dgraph.type": uid_result["dgraph.type"]}
-            if type == "graph":
-                uid_result_reduced["label"] = get_label(uid_result)
-            # Do not select any attribute values for the parent node
-            for attribute, value in uid_result.items():
-                if isinstance(value, List) and attribute not in ["dgraph.type", "hostname.type", "files.analyzers", "http.resp_mime_types", "notice.actions", "dns.answers"]:
-                    value[:] = [x for x in value if len(x) > 2 ]
-                    if len(value) > 0:
-                        if type == "graph":
-                            for value_node in value:
-                                value_node["label"] = get_label(value_node)
-                        uid_result_reduced[attribute] = value
-                else:
-                    uid_result_reduced[attribute] = value
-            neighbors.append(uid_result_reduced)
-        result = {"getAllNodeNeighbors": neighbors}    
-
-    # Process response accoring to the query type   
-    return {"response": dgraph_processing.process_response(response=result)}
+    return {"response": processed_response}
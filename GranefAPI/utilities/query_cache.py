@@ -0,0 +1,246 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Granef -- graph-based network forensics toolkit
+# Copyright (C) 2020-2021  Milan Cermak, Institute of Computer Science of Masaryk University
+# Copyright (C) 2020-2021  Denisa Sramkova, Institute of Computer Science of Masaryk University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+"""
+In-process cache of Dgraph query responses for read-only Granef API endpoints.
+
+Responses are stored as raw JSON bytes returned by Dgraph and are keyed by a hash of the final query
+string and its variables, so every distinct query maps to its own compact cache entry. Identical queries requested
+while the first one is still being performed wait for its response instead of querying Dgraph again.
+The number of entries, their total size in bytes, the maximal size of one response, and the time-to-live can be
+set by GRANEF_CACHE_SIZE, GRANEF_CACHE_BYTES, GRANEF_CACHE_ENTRY_BYTES, and GRANEF_CACHE_TTL environment variables.
+Responses cached in advance by warm_query use a longer time-to-live set by GRANEF_CACHE_WARM_TTL.
+"""
+
+# Common Python modules
+import asyncio
+import hashlib
+import orjson
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# GranefAPI
+from utilities.dgraph_client import SingletonMeta, DgraphClient
+
+
+class QueryCache(metaclass=SingletonMeta):
+    """Least recently used cache with time-to-live of Dgraph query responses.
+
+    Available as a singleton so all routers share the same cache entries.
+    """
+    maxsize = int(os.environ.get("GRANEF_CACHE_SIZE", 1024))  # Maximal number of cached responses
+    max_bytes = int(os.environ.get("GRANEF_CACHE_BYTES", 256 * 1024 * 1024))  # Maximal total size of cached responses
+    max_entry_bytes = int(os.environ.get("GRANEF_CACHE_ENTRY_BYTES", 16 * 1024 * 1024))  # Larger responses are not cached
+    ttl = int(os.environ.get("GRANEF_CACHE_TTL", 60))  # Number of seconds for which a cached response is valid
+    warm_ttl = int(os.environ.get("GRANEF_CACHE_WARM_TTL", 3600))  # Number of seconds for which a warmed response is valid
+
+    def __init__(self):
+        self.__entries = OrderedDict()
+        self.__lock = threading.RLock()
+        self.__bytes = 0
+        self.__hits = 0
+        self.__misses = 0
+
+
+    def get(self, key: bytes):
+        """Get cached response for the given key.
+
+        Args:
+            key (bytes): Cache key of the query.
+
+        Returns:
+            bytes: Cached response as raw JSON bytes or None if the response is not cached or already expired.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self.__remove(key)
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry[1]
+
+
+    def set(self, key: bytes, response: bytes, ttl: int = None) -> None:
+        """Store the response and evict the least recently used entries above the cache size.
+
+        Responses larger than max_entry_bytes are not stored.
+
+        Args:
+            key (bytes): Cache key of the query.
+            response (bytes): Response to store.
+            ttl (int, optional): Number of seconds for which the response is valid. Defaults to the cache ttl.
+        """
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            if len(response) > self.max_entry_bytes:
+                return
+            self.__entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), response)
+            self.__bytes += len(response)
+            while len(self.__entries) > self.maxsize or self.__bytes > self.max_bytes:
+                self.__remove(next(iter(self.__entries)))
+
+
+    def __remove(self, key: bytes) -> None:
+        """Remove the entry and subtract its size from the cache size (the lock must be held by the caller).
+
+        Args:
+            key (bytes): Cache key of the entry.
+        """
+        self.__bytes -= len(self.__entries.pop(key)[1])
+
+
+    def clear(self) -> None:
+        """Remove all cached responses and reset statistics.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+            self.__hits = 0
+            self.__misses = 0
+
+
+    def stats(self) -> dict:
+        """Get cache usage statistics.
+
+        Returns:
+            dict: Number of cached entries and their size in bytes, cache limits, time-to-live, hits, and misses.
+        """
+        with self.__lock:
+            return {
+                "entries": len(self.__entries),
+                "bytes": self.__bytes,
+                "maxsize": self.maxsize,
+                "max_bytes": self.max_bytes,
+                "max_entry_bytes": self.max_entry_bytes,
+                "ttl": self.ttl,
+                "warm_ttl": self.warm_ttl,
+                "hits": self.__hits,
+                "misses": self.__misses
+            }
+
+
+def query_key(query: str, variables: dict = None) -> bytes:
+    """Compute cache key of the query and its variables.
+
+    Args:
+        query (str): Query string.
+        variables (dict, optional): Dictionary of variables name and corresponding value. Defaults to None.
+
+    Returns:
+        bytes: 16 bytes long BLAKE2b digest of the query and its sorted variables.
+    """
+    digest = hashlib.blake2b(query.encode(), digest_size=16)
+    if variables:
+        digest.update(orjson.dumps(variables, option=orjson.OPT_SORT_KEYS))
+    return digest.digest()
+
+
+# Tasks of the queries currently performed in Dgraph, keyed by the cache key
+_in_flight = {}
+
+
+async def _perform_query(key: bytes, query: str, variables: dict = None) -> bytes:
+    """Perform the query using DgraphClient and store its response in the cache.
+
+    Args:
+        key (bytes): Cache key of the query.
+        query (str): Query string to perform.
+        variables (dict, optional): Dictionary of variables name and corresponding value. Defaults to None.
+
+    Returns:
+        bytes: Obtained response as raw JSON bytes.
+    """
+    # Raises HTTPException if the query fails, so only valid responses are cached
+    response = await DgraphClient().query(query, variables)
+    QueryCache().set(key, response)
+    return response
+
+
+def _query_done(key: bytes, task: asyncio.Task) -> None:
+    """Remove the finished query task from the performed queries.
+
+    Args:
+        key (bytes): Cache key of the query.
+        task (asyncio.Task): Finished query task.
+    """
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+    # Mark the exception as retrieved in case all waiting requests were cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+async def cached_query(query: str, variables: dict = None) -> bytes:
+    """Perform given query using DgraphClient or return its cached response.
+
+    Identical queries share one task performing the query. A cancelled request stops only waiting for the
+    response, the query is finished for the other requests and the cache.
+
+    Args:
+        query (str): Query string to perform.
+        variables (dict, optional): Dictionary of variables name and corresponding value. Defaults to None.
+
+    Returns:
+        bytes: Obtained response as raw JSON bytes.
+    """
+    key = query_key(query, variables)
+
+    response = QueryCache().get(key)
+    if response is not None:
+        return response
+
+    # Wait for the same query if it is already being performed, otherwise start it
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_perform_query(key, query, variables))
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _query_done(key, done))
+    return await asyncio.shield(task)
+
+
+async def warm_query(query: str, variables: dict = None) -> bytes:
+    """Perform given query and store its response in the cache for the warm time-to-live.
+
+    The query is always performed, so an already cached response is refreshed.
+
+    Args:
+        query (str): Query string to perform.
+        variables (dict, optional): Dictionary of variables name and corresponding value. Defaults to None.
+
+    Raises:
+        HTTPException (status: 503): Database is not connected.
+        HTTPException (status: 500): The query transaction failed.
+
+    Returns:
+        bytes: Obtained response as raw JSON bytes.
+    """
+    query_cache = QueryCache()
+    response = await DgraphClient().query(query, variables)
+    query_cache.set(query_key(query, variables), response, query_cache.warm_ttl)
+    return response
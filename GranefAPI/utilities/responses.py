@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Granef -- graph-based network forensics toolkit
+# Copyright (C) 2020-2021  Milan Cermak, Institute of Computer Science of Masaryk University
+# Copyright (C) 2020-2021  Denisa Sramkova, Institute of Computer Science of Masaryk University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+"""
+Custom response classes of Granef API.
+"""
+
+# Common Python modules
+import re
+
+# Fast JSON serialization
+import orjson
+
+# FastAPI modules
+from fastapi.responses import JSONResponse, Response
+
+
+# Bytes other than JSON structure characters (deleted to check nesting of a raw response)
+_NON_STRUCTURE_BYTES = bytes(set(range(256)) - set(b"[]{},"))
+# Innermost array or object of the response structure
+_INNERMOST_GROUP = re.compile(rb"\[[^\[\]{}]*\]|\{[^\[\]{}]*\}")
+
+
+def _is_single_value(body: bytes) -> bool:
+    """Check that the raw JSON body is one value only, i.e. it is not followed by other keys of the enclosing object.
+
+    Contents of strings are removed first, so brackets and commas in values are not taken into account. Then the
+    innermost arrays and objects are removed until only separators outside of any array or object remain.
+
+    Args:
+        body (bytes): Raw JSON of an object value.
+
+    Returns:
+        bool: True if the body contains no top-level separator, False otherwise.
+    """
+    if b"\\" in body:
+        body = body.replace(b"\\\\", b"").replace(b'\\"', b"")
+    structure = b"".join(body.split(b'"')[::2]).translate(None, _NON_STRUCTURE_BYTES)
+    while True:
+        reduced = _INNERMOST_GROUP.sub(b"", structure)
+        if reduced == structure:
+            return not structure
+        structure = reduced
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized by orjson instead of the standard json module.
+
+    Non-string dictionary keys (e.g. integer groupby values returned by Dgraph) are serialized as strings.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def block_response(response: bytes, block: str) -> Response:
+    """Wrap result of the query block in the API response without parsing and serializing it again.
+
+    Dgraph returns a single block query as {"<block>":[...]}, so the result is spliced to the response
+    bytes directly. Other responses (e.g. with more blocks) are parsed and serialized as usual.
+
+    Args:
+        response (bytes): Raw JSON response of a query containing only the given block.
+        block (str): Name of the query block.
+
+    Returns:
+        Response: JSON response in the form {"response": [...]}.
+    """
+    prefix = b'{"' + block.encode() + b'":'
+    if response.startswith(prefix) and response.endswith(b"}") and _is_single_value(response[len(prefix):-1]):
+        content = b'{"response":' + response[len(prefix):-1] + b"}"
+    else:
+        content = orjson.dumps({"response": orjson.loads(response).get(block, [])}, option=orjson.OPT_NON_STR_KEYS)
+    return Response(content=content, media_type="application/json")
@@ -26,12 +26,26 @@ Definition of functions to ease data validation.
 """
 
 # Common Python modules
+import functools
 import ipaddress
+import re
 
 # FastAPI modules
 from fastapi import HTTPException
 
 
+# Plain IPv4 address (octets without leading zeros), compiled once for the most common validated value
+_IPV4_OCTET = "(?:25[0-5]|2[0-4][0-9]|1[0-9]{2}|[1-9]?[0-9])"
+_IPV4_ADDRESS = re.compile(_IPV4_OCTET + "(?:\\." + _IPV4_OCTET + "){3}")
+
+# Name of a Dgraph type
+_TYPE_NAME = re.compile("[A-Za-z_][A-Za-z0-9_.]*")
+
+# Name of a Dgraph predicate (reverse edges and special characters are not allowed)
+_PREDICATE_NAME = re.compile("[A-Za-z_][A-Za-z0-9_.]*")
+
+
+@functools.lru_cache(maxsize=4096)
 def is_address(address: str) -> bool:
     """Validation of a given sting if its IPv4 and IPv6 address.
 
@@ -41,12 +55,46 @@ def is_address(address: str) -> bool:
     Returns:
         bool: True if given address is valid IPv4 or IPv6 address, False otherwise.
     """
+    if _IPV4_ADDRESS.fullmatch(address):
+        return True
+    # Plain IPv6 address is parsed without the network prefix logic
     try:
-        ipaddress.ip_network(address)
+        ipaddress.ip_address(address)
         return True
-    except (OSError, ValueError):
+    except ValueError:
         pass
-    return False
+    # Network range in CIDR notation (host bits must not be set)
+    try:
+        ipaddress.ip_network(address)
+        return True
+    except ValueError:
+        return False
+
+
+@functools.lru_cache(maxsize=4096)
+def is_type_list(types: str) -> bool:
+    """Validation of a given string if its comma separated list of Dgraph type names.
+
+    Args:
+        types (str): String to validate.
+
+    Returns:
+        bool: True if each item is a valid type name, False otherwise.
+    """
+    return all(_TYPE_NAME.fullmatch(name.strip()) for name in types.split(","))
+
+
+@functools.lru_cache(maxsize=4096)
+def is_predicate(predicate: str) -> bool:
+    """Validation of a given string if its Dgraph predicate name.
+
+    Args:
+        predicate (str): String to validate.
+
+    Returns:
+        bool: True if given string is a valid predicate name, False otherwise.
+    """
+    return _PREDICATE_NAME.fullmatch(predicate) is not None
 
 
 def validate(variable, type: str) -> bool:
@@ -54,7 +102,7 @@ def validate(variable, type: str) -> bool:
 
     Args:
         variable (any type): Variable that should be validated.
-        type (str): Required type of the variable. Available options: address
+        type (str): Required type of the variable. Available options: address, types, predicate
 
     Raises:
         HTTPException (status 400): Details about the validations if the variable is not valid.
@@ -73,6 +121,12 @@ def validate(variable, type: str) -> bool:
     elif type == "address_first" or type == "address_second":
         validation_result = is_address(variable)
         validation_fail_detail = f"Given address '{variable}' is not valid IPv4, IPv6 address, or CIDR notation."
+    elif type == "types":
+        validation_result = is_type_list(variable)
+        validation_fail_detail = f"Given types '{variable}' are not valid comma separated Dgraph type names."
+    elif type == "predicate":
+        validation_result = isinstance(variable, str) and is_predicate(variable)
+        validation_fail_detail = f"Given attribute '{variable}' is not valid Dgraph predicate name."
 
     # Raise HTTPException if the validation failed
     if not validation_result: